@@ -3,48 +3,75 @@ import music21 as m21
 import os
 import sys
 import numpy as np
+from collections import namedtuple
 
 # Constants
 VALID_DURATIONS = [4.0, 2.0, 1.0, 0.5, 0.25, 0.125]  # Whole to 16th notes
 DEFAULT_TIME_SIGNATURE = (4, 4)
 
+# Piece of a note cut at a bar line; tie is 'start', 'continue' or 'stop'
+NoteSegment = namedtuple('NoteSegment', ['velocity', 'pitch', 'start', 'end', 'tie'])
+
 def round_duration(duration):
     return min(VALID_DURATIONS, key=lambda x: abs(x - duration))
 
-def group_notes_into_measures(notes, measure_duration):
+def compute_bar_lines(end_time, measure_duration):
+    """Return bar line times from 0 up to the first bar strictly after end_time."""
+    num_measures = int(end_time // measure_duration) + 1
+    bar_lines = np.arange(num_measures + 1) * measure_duration
+    # Guard against float rounding leaving the closing bar at or below end_time
+    while bar_lines[-1] <= end_time:
+        bar_lines = np.append(bar_lines, bar_lines[-1] + measure_duration)
+    return bar_lines
+
+def group_notes_into_measures(notes, bar_lines, tolerance=0.0):
+    """Cut every note at each bar line it crosses and group the pieces by measure.
+
+    Notes sustained over several bar lines yield one segment per measure they
+    cover, tagged 'start', 'continue' or 'stop' so they can be tied together.
+    Onsets and releases within `tolerance` of a bar line snap to it, so small
+    timing drift does not leave slivers on the other side of the bar.
+    """
     measures = {}
-    for note in notes:
-        # Calculate which measure this note starts in
-        start_measure = int(note.start / measure_duration)
-        
-        # Check if the note extends significantly into the next measure
-        end_measure = int(note.end / measure_duration)
-        
-        # If the note extends into the next measure, we need to split it
-        if end_measure > start_measure:
-            # Calculate the split point at the measure boundary
-            split_time = (start_measure + 1) * measure_duration
-            
-            # Create a copy of the note for the first measure
-            first_note = pretty_midi.Note(
-                velocity=note.velocity,
-                pitch=note.pitch,
-                start=note.start,
-                end=split_time
-            )
-            measures.setdefault(start_measure, []).append(first_note)
-            
-            # Create a copy of the note for the second measure
-            second_note = pretty_midi.Note(
-                velocity=note.velocity,
-                pitch=note.pitch,
-                start=split_time,
-                end=note.end
-            )
-            measures.setdefault(end_measure, []).append(second_note)
+    if not notes:
+        return measures
+
+    starts = np.array([note.start for note in notes])
+    ends = np.array([note.end for note in notes])
+    last_measure = len(bar_lines) - 2
+
+    # Measure index each note starts in, and the last measure it sounds in
+    # (a note ending on a bar line does not spill into the next one)
+    start_idx = np.searchsorted(bar_lines, starts + tolerance, side='right') - 1
+    start_idx = np.clip(start_idx, 0, last_measure)
+    end_idx = np.searchsorted(bar_lines, ends - tolerance, side='left') - 1
+    end_idx = np.clip(end_idx, start_idx, last_measure)
+
+    # Expand each note into one row per measure it covers
+    spans = end_idx - start_idx + 1
+    note_idx = np.repeat(np.arange(len(notes)), spans)
+    offsets = np.arange(len(note_idx)) - np.repeat(np.cumsum(spans) - spans, spans)
+    measure_idx = start_idx[note_idx] + offsets
+    seg_starts = np.clip(starts[note_idx], bar_lines[measure_idx], bar_lines[measure_idx + 1])
+    seg_ends = np.clip(ends[note_idx], seg_starts, bar_lines[measure_idx + 1])
+    seg_spans = spans[note_idx]
+
+    for i, m, offset, span, seg_start, seg_end in zip(
+            note_idx.tolist(), measure_idx.tolist(), offsets.tolist(),
+            seg_spans.tolist(), seg_starts.tolist(), seg_ends.tolist()):
+        if span == 1:
+            tie = None
+        elif offset == 0:
+            tie = 'start'
+        elif offset == span - 1:
+            tie = 'stop'
         else:
-            measures.setdefault(start_measure, []).append(note)
-    
+            tie = 'continue'
+        note = notes[i]
+        measures.setdefault(m, []).append(
+            NoteSegment(note.velocity, note.pitch, seg_start, seg_end, tie)
+        )
+
     return measures
 
 def calculate_rhythmic_duration(note_start, next_start, measure_start, measure_end, measure_notes):
@@ -92,14 +119,18 @@ def quantize_notes_in_measure(notes, quarter_note_duration, measure_start, measu
         start_time = chord[0].start
         next_start = chords[i + 1][0].start if i + 1 < len(chords) else None
         
-        # Calculate duration considering measure context
-        duration = calculate_rhythmic_duration(
-            start_time, 
-            next_start,
-            measure_start,
-            measure_end,
-            chords
-        )
+        # A final chord tied over the bar line must last until its real end
+        if next_start is None and any(n.tie in ('start', 'continue') for n in chord):
+            duration = max(n.end for n in chord) - start_time
+        else:
+            # Calculate duration considering measure context
+            duration = calculate_rhythmic_duration(
+                start_time, 
+                next_start,
+                measure_start,
+                measure_end,
+                chords
+            )
         
         # Convert to quarter note units and round to valid duration
         duration_qn = round_duration(duration / quarter_note_duration)
@@ -107,26 +138,60 @@ def quantize_notes_in_measure(notes, quarter_note_duration, measure_start, measu
     
     return quantized
 
-def create_part(measures, clef, quarter_note_duration, measure_duration):
+def resolve_ties(chord_notes, is_first, is_last, tied_in):
+    """Return the tie type for each note of a chord, or None where no tie fits.
+
+    A segment can only tie back if it opens the measure and the previous
+    measure tied into its pitch, and only tie forward if it closes the measure;
+    anything else would leave a dangling tie next to a different note.
+    """
+    ties = []
+    for note in chord_notes:
+        tie_in = is_first and note.tie in ('stop', 'continue') and note.pitch in tied_in
+        tie_out = is_last and note.tie in ('start', 'continue')
+        if tie_in and tie_out:
+            ties.append('continue')
+        elif tie_in:
+            ties.append('stop')
+        elif tie_out:
+            ties.append('start')
+        else:
+            ties.append(None)
+    return ties
+
+def create_part(measures, clef, quarter_note_duration, bar_lines):
     part = m21.stream.Part()
     part.append(m21.clef.TrebleClef() if clef == 'treble' else m21.clef.BassClef())
 
+    tied_in, prev_idx = set(), None
     for idx in sorted(measures):
+        if prev_idx != idx - 1:
+            tied_in = set()
         m = m21.stream.Measure(number=idx + 1)
         quantized_chords = quantize_notes_in_measure(
             measures[idx], 
             quarter_note_duration,
-            idx * measure_duration,
-            (idx + 1) * measure_duration
+            bar_lines[idx],
+            bar_lines[idx + 1]
         )
-        for _, chord_notes, dur in quantized_chords:
+        tied_out = set()
+        for i, (_, chord_notes, dur) in enumerate(quantized_chords):
+            ties = resolve_ties(chord_notes, i == 0, i == len(quantized_chords) - 1, tied_in)
             if len(chord_notes) == 1:
                 n = m21.note.Note(chord_notes[0].pitch)
+                members = [n]
             else:
                 n = m21.chord.Chord([note.pitch for note in chord_notes])
+                members = n.notes
+            for member, note, tie in zip(members, chord_notes, ties):
+                if tie:
+                    member.tie = m21.tie.Tie(tie)
+                    if tie in ('start', 'continue'):
+                        tied_out.add(note.pitch)
             n.duration = m21.duration.Duration(dur)
             m.append(n)
         part.append(m)
+        tied_in, prev_idx = tied_out, idx
     return part
 
 def midi_to_musicxml(midi_path, bpm):
@@ -140,14 +205,16 @@ def midi_to_musicxml(midi_path, bpm):
             for note in instrument.notes:
                 (treble_notes if note.pitch >= 60 else bass_notes).append(note)
 
-    treble_measures = group_notes_into_measures(treble_notes, measure_duration)
-    bass_measures = group_notes_into_measures(bass_notes, measure_duration)
+    bar_lines = compute_bar_lines(midi_data.get_end_time(), measure_duration)
+    bar_tolerance = quarter_note_duration * 0.1
+    treble_measures = group_notes_into_measures(treble_notes, bar_lines, bar_tolerance)
+    bass_measures = group_notes_into_measures(bass_notes, bar_lines, bar_tolerance)
 
     score = m21.stream.Score()
     score.append(m21.tempo.MetronomeMark(number=bpm))
     score.append(m21.meter.TimeSignature(f"{DEFAULT_TIME_SIGNATURE[0]}/{DEFAULT_TIME_SIGNATURE[1]}"))
-    score.insert(0, create_part(treble_measures, 'treble', quarter_note_duration, measure_duration))
-    score.insert(0, create_part(bass_measures, 'bass', quarter_note_duration, measure_duration))
+    score.insert(0, create_part(treble_measures, 'treble', quarter_note_duration, bar_lines))
+    score.insert(0, create_part(bass_measures, 'bass', quarter_note_duration, bar_lines))
 
     output_path = f"{os.path.splitext(midi_path)[0]}.musicxml"
     score.write('musicxml', fp=output_path)
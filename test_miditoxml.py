@@ -0,0 +1,83 @@
+import pretty_midi
+import music21 as m21
+
+from miditoxml import compute_bar_lines, group_notes_into_measures, create_part
+
+
+def note(start, end, pitch=60):
+    return pretty_midi.Note(velocity=80, pitch=pitch, start=start, end=end)
+
+
+def ties_by_measure(part):
+    return [
+        [(n.pitch.midi, n.tie.type if n.tie else None) for el in m.notes for n in (el.notes if el.isChord else [el])]
+        for m in part.getElementsByClass(m21.stream.Measure)
+    ]
+
+
+def test_bar_lines_close_strictly_after_end_time():
+    assert list(compute_bar_lines(4.0, 2.0)) == [0.0, 2.0, 4.0, 6.0]
+    for bpm in (87.0, 93.0, 117.0, 133.0):
+        measure_duration = 4 * 60 / bpm
+        for k in range(1, 50):
+            end = k * measure_duration
+            assert compute_bar_lines(end, measure_duration)[-1] > end
+
+
+def test_note_spanning_several_measures_is_split_and_tied():
+    measures = group_notes_into_measures([note(1.0, 7.0)], compute_bar_lines(7.0, 2.0))
+    assert sorted(measures) == [0, 1, 2, 3]
+    assert [(s.start, s.end, s.tie) for m in sorted(measures) for s in measures[m]] == [
+        (1.0, 2.0, 'start'), (2.0, 4.0, 'continue'), (4.0, 6.0, 'continue'), (6.0, 7.0, 'stop'),
+    ]
+
+
+def test_offsets_restart_for_each_note():
+    notes = [note(0.5, 5.0, 60), note(1.0, 1.5, 64), note(3.0, 9.0, 67)]
+    measures = group_notes_into_measures(notes, compute_bar_lines(9.0, 2.0))
+    pieces = {m: [(s.pitch, s.tie) for s in measures[m]] for m in measures}
+    assert pieces == {
+        0: [(60, 'start'), (64, None)],
+        1: [(60, 'continue'), (67, 'start')],
+        2: [(60, 'stop'), (67, 'continue')],
+        3: [(67, 'continue')],
+        4: [(67, 'stop')],
+    }
+
+
+def test_note_ending_on_bar_line_stays_in_its_measure():
+    measures = group_notes_into_measures([note(0.0, 2.0)], compute_bar_lines(2.0, 2.0))
+    assert list(measures) == [0]
+    assert measures[0][0].tie is None
+
+
+def test_zero_length_note_on_last_bar_line():
+    notes = [note(0.0, 4.0), note(4.0, 4.0)]
+    measures = group_notes_into_measures(notes, compute_bar_lines(4.0, 2.0))
+    assert [(s.start, s.end) for s in measures[2]] == [(4.0, 4.0)]
+
+
+def test_release_just_after_bar_line_leaves_no_sliver():
+    measures = group_notes_into_measures([note(0.0, 2.004)], compute_bar_lines(2.004, 2.0), tolerance=0.05)
+    assert list(measures) == [0]
+    assert (measures[0][0].end, measures[0][0].tie) == (2.0, None)
+
+
+def test_ties_are_dropped_when_another_onset_follows():
+    # Held C under a moving melody: the C is cut short by the next onset,
+    # so it cannot carry a tie into the next measure.
+    notes = [note(0.0, 3.0, 60), note(1.0, 2.0, 64), note(2.5, 3.0, 67)]
+    measures = group_notes_into_measures(notes, compute_bar_lines(3.0, 2.0))
+    part = create_part(measures, 'treble', 0.5, compute_bar_lines(3.0, 2.0))
+    assert ties_by_measure(part) == [[(60, None), (64, None)], [(60, None), (67, None)]]
+
+
+def test_ties_connect_last_and_first_elements():
+    notes = [note(0.0, 1.0, 64), note(1.0, 5.0, 60), note(1.0, 5.0, 67)]
+    bar_lines = compute_bar_lines(5.0, 2.0)
+    part = create_part(group_notes_into_measures(notes, bar_lines), 'treble', 0.5, bar_lines)
+    assert ties_by_measure(part) == [
+        [(64, None), (60, 'start'), (67, 'start')],
+        [(60, 'continue'), (67, 'continue')],
+        [(60, 'stop'), (67, 'stop')],
+    ]